@@ -1,5 +1,40 @@
-from .gitaux import *
-from .terminal2png import *
+"""
+Submodules are imported on first attribute access (PEP 562), so that e.g. pullall.py does not pay
+for PIL, pyte etc. which are only needed by the terminal renderer.
+"""
+import importlib as _importlib
+
+# {attribute name: submodule (relative to this package) that provides it}
+_LAZY = {
+    "gitaux": ".gitaux",
+    "gitaux_main": ".gitaux",
+    "terminal2png": ".terminal2png",
+    "render_ansi": ".terminal2png",
+    "COLS": ".terminal2png",
+    "ROWS": ".terminal2png",
+    "CHAR_WIDTH": ".terminal2png",
+    "CHAR_HEIGHT": ".terminal2png",
+    "FONT_SIZE": ".terminal2png",
+    "FONT_CAT": ".terminal2png",
+}
+
+__all__ = ["asciilogo", *_LAZY]
+
+
+def __getattr__(name):
+    try:
+        modname = _LAZY[name]
+    except KeyError:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'") from None
+    module = _importlib.import_module(modname, __name__)
+    value = module if modname == "."+name else getattr(module, name)
+    globals()[name] = value  # caches, so __getattr__() is not called again for this name
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
 
 def asciilogo():
 
@@ -5,6 +5,18 @@ and system exits.
 import sys
 import os
 import logging
+import argparse
+import fnmatch
+import hashlib
+import json
+import re
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import subprocess
+import concurrent.futures
 import a107
 
 __all__ = ["gitaux_main"]
@@ -12,67 +24,524 @@ __all__ = ["gitaux_main"]
 PWD = ""
 MSG = ""
 FN = "repos.txt"
+# Directory for the repository index, one file per working directory. Kept out of the working directory
+# because writing it there would change the mtime of a directory that the index itself records
+DIR_INDEX = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                         "aleatools")
+# Directory names (glob patterns) not descended into when looking for repositories, unless they are
+# repositories themselves
+DEFAULT_EXCLUDES = ["node_modules", "__pycache__", ".venv", "venv", "env", ".tox", ".nox", "build", "dist",
+                    "*.egg-info", ".mypy_cache", ".pytest_cache"]
 
 
-def push_pull_1(flag_push, repo):
-    """chdir; (git add+commit+push) or (git pull); restore dir"""
-    print("\n".join(a107.format_box(repo)))
-    try:
-        os.chdir(os.path.join(PWD, repo))
+def run_git(args, cwd):
+    """Runs "git <args>" inside directory cwd. Returns (exit code, output), stderr merged into output."""
+    proc = subprocess.run(["git"]+args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          stdin=subprocess.DEVNULL)
+    return proc.returncode, proc.stdout.decode("utf-8", "replace")
+
+
+def probe_repo(cwd):
+    """Inspects repository state using "git status" only (no network).
+
+    Returns:
+        (flag_dirty, ahead, behind): ahead/behind are commit counts relative to the upstream branch as
+        of the last fetch, or None if the current branch has no upstream (or HEAD is detached)
+    """
+    code, output = run_git(["status", "--porcelain=v2", "--branch"], cwd)
+    if code != 0:
+        raise RuntimeError(f"'git status' exited with code {code}: {output.strip()}")
+    flag_dirty, ahead, behind = False, None, None
+    for line in output.splitlines():
+        if line.startswith("# branch.ab "):
+            _ahead, _behind = line.split()[2:4]  # e.g. "+1 -0"
+            ahead, behind = int(_ahead), -int(_behind)
+        elif line and not line.startswith("#"):
+            flag_dirty = True
+    return flag_dirty, ahead, behind
+
+
+# Steps that talk to the remote; these are run with "--progress" so that the transfer is reported
+NETWORK_STEPS = ("fetch", "pull", "push")
+# Progress meters, dropped from the printed output
+_PROGRESS_RE = re.compile(r"^(?:remote: )?(?:(?:Enumerating|Counting|Compressing|Writing|Receiving|Unpacking) objects:|"
+                          r"Resolving deltas:|Delta compression)")
+_TOTAL_RE = re.compile(r"^(?:remote: )?Total (\d+) ")
+_SIZE_RE = re.compile(r"^(?:Writing|Receiving|Unpacking) objects: 100% .*?, ([\d.]+) (bytes|KiB|MiB|GiB)")
+_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024**2, "GiB": 1024**3}
+
+
+def parse_transfer(output):
+    """Extracts (number of objects, number of bytes) transferred from git --progress output.
+
+    Either may be None if git did not report it (git only shows some meters if the transfer is slow).
+    """
+    objects, bytes_ = None, None
+    for line in output.split("\n"):
+        line = line.split("\r")[-1]
+        m = _TOTAL_RE.match(line)
+        if m:
+            objects = (objects or 0)+int(m.group(1))
+        m = _SIZE_RE.match(line)
+        if m:
+            bytes_ = (bytes_ or 0)+int(float(m.group(1))*_UNITS[m.group(2)])
+    return objects, bytes_
 
+
+def _clean_output(output):
+    """Keeps only the final state of "\r"-updated lines and drops local progress meters."""
+    lines = (line.split("\r")[-1].rstrip() for line in output.split("\n"))
+    return "\n".join(line for line in lines if line and not _PROGRESS_RE.match(line))
+
+
+def push_pull_1(flag_push, repo, flag_force=False):
+    """(git add+commit+push) or (git pull) inside repo.
+
+    Does not touch the process working directory, so it is safe to call from several threads.
+
+    Unless flag_force, repositories are probed first (see probe_repo()) and steps that would have no effect
+    are left out: a clean repository is only pushed if ahead of its upstream; before pulling, one
+    "git fetch" is run and the repository is only pulled if behind.
+
+    Returns:
+        (result, output): output is the text to be printed for this repository. result is a dict with keys
+        "repo", "status" ("ok", "skipped" or "failed"), "time" (wall time in seconds), "objects",
+        "bytes" (transferred, None if unknown) and "steps", a list of {"step", "code", "time"}.
+        "git commit" having nothing to commit is not considered a failure.
+    """
+    lines = ["\n".join(a107.format_box(repo))]
+    result = {"repo": repo, "status": "ok", "time": 0., "objects": None, "bytes": None, "steps": []}
+    t0 = time.perf_counter()
+
+    def add_transfer(objects, bytes_):
+        for key, value in (("objects", objects), ("bytes", bytes_)):
+            if value is not None:
+                result[key] = (result[key] or 0)+value
+
+    def run_step(step):
+        t = time.perf_counter()
+        flag_network = step[0] in NETWORK_STEPS
+        code, output = run_git(step[:1]+["--progress"]+step[1:] if flag_network else step, cwd)
+        result["steps"].append({"step": step[0], "code": code, "time": time.perf_counter()-t})
+        if flag_network:
+            add_transfer(*parse_transfer(output))
+        lines.append(_clean_output(output))
+        if code != 0 and step[0] != "commit":
+            lines.append(f"*** 'git {step[0]}' exited with code {code}")
+            return False
+        return True
+
+    try:
+        cwd = os.path.join(PWD, repo)
         if flag_push:
-            os.system("git add . --all")
-            os.system("git commit -m \"{}\"".format(MSG))
-            os.system("git push")
+            steps = [["add", ".", "--all"], ["commit", "-m", MSG], ["push"]]
         else:
-            os.system("git pull")
+            steps = [["pull"]]
 
-        os.chdir(PWD)
-    except:
+        if not flag_force:
+            if not flag_push and not run_step(["fetch"]):
+                steps = None
+            else:
+                t = time.perf_counter()
+                flag_dirty, ahead, behind = probe_repo(cwd)
+                result["steps"].append({"step": "status", "code": 0, "time": time.perf_counter()-t})
+                if flag_push:
+                    if not flag_dirty and ahead is not None:
+                        steps = [["push"]] if ahead > 0 else []
+                elif behind == 0:
+                    steps = []
+
+        if steps is None:
+            result["status"] = "failed"
+        elif not steps:
+            result["status"] = "skipped"
+            lines = [f"'{repo}': nothing to {'push' if flag_push else 'pull'}, skipped"]
+        else:
+            for step in steps:
+                if not run_step(step):
+                    result["status"] = "failed"
+                    break
+    except Exception as e:
         logging.exception("Failed '{}'".format(repo))
+        lines.append(f"*** {e.__class__.__name__}: {e}")
+        result["status"] = "failed"
+
+    result["time"] = time.perf_counter()-t0
+    return result, "\n".join(line for line in lines if line)
+
+
+def format_report(results):
+    """Returns summary table (list of lines) of push_pull_1() results, slowest repository first."""
+    def fmt_bytes(n):
+        for unit in ("B", "KiB", "MiB"):
+            if n < 1024:
+                return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+            n /= 1024
+        return f"{n:.1f} GiB"
+
+    results = sorted(results, key=lambda r: r["time"], reverse=True)
+    rows = [("repository", "status", "time (s)", "objects", "transferred", "steps (exit code)")]
+    for r in results:
+        rows.append((r["repo"], r["status"], f"{r['time']:.2f}",
+                     "-" if r["objects"] is None else str(r["objects"]),
+                     "-" if r["bytes"] is None else fmt_bytes(r["bytes"]),
+                     " ".join(f"{x['step']}:{x['code']}" for x in r["steps"])))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    ret = ["  ".join(cell.ljust(w) if i in (0, 1, 5) else cell.rjust(w)
+                     for i, (cell, w) in enumerate(zip(row, widths))).rstrip() for row in rows]
+    ret.insert(1, "-"*len(ret[0]))
+    return ret
+
+
+def find_repos(root, excludes=(), flag_submodules=False):
+    """Looks for git repositories in the directory tree under root.
+
+    Does not descend into a repository once found (unless flag_submodules), nor into directories whose
+    names match any of the glob patterns in excludes.
+
+    Returns:
+        (repos, mtimes): mtimes maps each directory that was listed, except repository roots, to its
+        st_mtime_ns. Creating or removing anything inside these directories changes their mtime,
+        so this is what is needed to tell whether repos is still up to date (see _is_index_entry_valid()).
+    """
+    repos, mtimes = [], {}
+    stack = [root]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            mtime = os.stat(dirpath).st_mtime_ns
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        flag_repo = any(entry.name == ".git" for entry in entries)
+        if flag_repo:
+            repos.append(dirpath)
+            if not flag_submodules:
+                continue
+        mtimes[dirpath] = mtime
+        subdirs = []
+        for entry in entries:
+            if entry.name == ".git" or not entry.is_dir(follow_symlinks=False):
+                continue
+            if any(fnmatch.fnmatch(entry.name, pattern) for pattern in excludes) and \
+                    not os.path.exists(os.path.join(entry.path, ".git")):
+                # not descended into, but a repository created inside it will change its mtime
+                try:
+                    mtimes[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+                except OSError:
+                    pass
+                continue
+            subdirs.append(entry.name)
+        stack.extend(os.path.join(dirpath, name) for name in reversed(subdirs))
+
+    return repos, mtimes
+
+
+def _is_index_entry_valid(entry):
+    try:
+        return all(os.stat(dirpath).st_mtime_ns == mtime for dirpath, mtime in entry["mtimes"].items()) and \
+               all(os.path.exists(os.path.join(repo, ".git")) for repo in entry["repos"])
+    except (OSError, KeyError, TypeError, AttributeError):
+        return False
+
+
+def index_filename():
+    """Returns name of repository index file for the current directory."""
+    key = hashlib.sha1(os.path.abspath(os.getcwd()).encode("utf-8", "surrogateescape")).hexdigest()[:16]
+    return os.path.join(DIR_INDEX, f"repos-index-{key}.json")
+
+
+def _load_index():
+    try:
+        with open(index_filename(), "r") as file:
+            index = json.load(file)
+        return index if isinstance(index, dict) else {}
+    except (OSError, ValueError):
+        return {}
 
 
-def get_repos():
-    f"""Parses file {FN} and returns list of repositories."""
+def _save_index(index):
+    filename = index_filename()
+    try:
+        os.makedirs(DIR_INDEX, exist_ok=True)
+        with open(filename+".tmp", "w") as file:
+            json.dump(index, file)
+        os.replace(filename+".tmp", filename)
+    except OSError:
+        logging.exception(f"Could not save repository index '{filename}'")
+
+
+def get_repos(excludes=None, flag_submodules=False, flag_cache=True):
+    f"""Parses file {FN} and returns list of repositories.
+
+    Args:
+        excludes: glob patterns of directory names to skip. Defaults to DEFAULT_EXCLUDES
+        flag_submodules: whether to keep looking for repositories inside repositories
+        flag_cache: whether to use the results cached in the index file (see index_filename()), as long as the directories
+                    are unchanged since they were scanned. The cache is rewritten in any case
+    """
     if not os.path.isfile(FN):
         print(f"File '{FN} not found in directory.\n"
               "Please create a list of repositories, one per line in the file.\n"
               "Comments (lines starting with '#') are allowed.\nGood luck :)")
         sys.exit()
     with open("repos.txt", "r") as file:
-        _repos = [x.strip() for x in file.readlines() if not x.strip().startswith("#")]
+        _repos = [x.strip() for x in file.readlines() if x.strip() and not x.strip().startswith("#")]
+
+    if excludes is None:
+        excludes = DEFAULT_EXCLUDES
 
     print("Figuring out repositories...")
+    old_index = _load_index() if flag_cache else {}
+    index = {}
     repos = []
+    num_cached = 0
     for r in _repos:
-        for dirpath, dirnames, filenames in os.walk(r):
-            if ".git" in dirnames:
-                repos.append(dirpath)
-    print(f"...found {len(repos)} repositories{'s' if len(repos) != 1 else ''}: {str(repos)[1:-1]}")
+        key = json.dumps([r, sorted(excludes), flag_submodules])
+        entry = old_index.get(key)
+        if entry is not None and _is_index_entry_valid(entry):
+            num_cached += 1
+        else:
+            _r, mtimes = find_repos(r, excludes, flag_submodules)
+            entry = {"repos": _r, "mtimes": mtimes}
+        index[key] = entry
+        repos.extend(entry["repos"])
+    if index != old_index:
+        _save_index(index)
+
+    s_cached = f" ({num_cached} of {len(_repos)} path{'s' if len(_repos) != 1 else ''} from cache)" if num_cached else ""
+    print(f"...found {len(repos)} repositor{'ies' if len(repos) != 1 else 'y'}{s_cached}: {str(repos)[1:-1]}")
     return repos
 
 
+class InotifyWatcher(object):
+    """Watches working trees of repositories for changes using Linux inotify (through ctypes).
+
+    Directories named ".git" or matching excludes are not watched, so git's own activity does not count
+    as a change. Raises OSError if inotify is not available.
+    """
+
+    IN_MODIFY, IN_ATTRIB, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = \
+        0x2, 0x4, 0x40, 0x80, 0x100, 0x200
+    IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x4000, 0x8000, 0x40000000
+    IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+    MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, repos, excludes=()):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify not available")
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1() failed")
+        self.repos = repos
+        self.excludes = excludes
+        # {watch descriptor: (repo, directory)}
+        self.wds = {}
+        for repo in repos:
+            self._add_tree(repo, repo)
+
+    def _add_tree(self, repo, root):
+        others = set(self.repos)-{repo}
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d != ".git" and os.path.join(dirpath, d) not in others
+                           and not any(fnmatch.fnmatch(d, pattern) for pattern in self.excludes)]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(os.path.join(PWD, dirpath)), self.MASK)
+            if wd < 0:
+                logging.warning(f"Cannot watch '{dirpath}': {os.strerror(ctypes.get_errno())}")
+                continue
+            self.wds[wd] = (repo, dirpath)
+
+    def wait(self, timeout):
+        """Waits up to timeout seconds for changes. Returns set of changed repositories."""
+        changed = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        buf = os.read(self.fd, 65536)
+        pos = 0
+        while pos < len(buf):
+            wd, mask, _, length = struct.unpack_from("iIII", buf, pos)
+            name = os.fsdecode(buf[pos+16:pos+16+length].rstrip(b"\0"))
+            pos += 16+length
+            if mask & self.IN_Q_OVERFLOW:
+                changed.update(self.repos)
+            elif mask & self.IN_IGNORED:
+                self.wds.pop(wd, None)
+            elif wd in self.wds:
+                repo, dirpath = self.wds[wd]
+                if name == ".git":
+                    continue
+                changed.add(repo)
+                if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self._add_tree(repo, os.path.join(dirpath, name))
+        return changed
+
+
+class PollingWatcher(object):
+    """Fallback for InotifyWatcher: polls "git status" of every repository every interval seconds.
+
+    A repository is reported as changed when its status differs from the previous poll and it is not clean.
+    """
+
+    def __init__(self, repos, interval=10.):
+        self.repos = repos
+        self.interval = interval
+        self.last = {repo: self._status(repo) for repo in repos}
+
+    @staticmethod
+    def _status(repo):
+        return run_git(["status", "--porcelain"], os.path.join(PWD, repo))
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        for repo in self.repos:
+            status = self._status(repo)
+            if status != self.last[repo] and status[1]:
+                changed.add(repo)
+            self.last[repo] = status
+        return changed
+
+
+def watch_repos(repos, excludes=(), debounce=10., jobs=1, flag_force=False, flag_poll=False, poll_interval=10.):
+    """Pushes repositories as they change, until interrupted with Ctrl+C.
+
+    Changed repositories are kept in a dirty set; each one is pushed once debounce seconds have
+    passed since its last change.
+    """
+    watcher = None
+    if not flag_poll:
+        try:
+            watcher = InotifyWatcher(repos, excludes)
+            print(f"Watching {len(watcher.wds)} directories in {len(repos)} repositories (inotify)...")
+        except OSError as e:
+            print(f"inotify unavailable ({e}), falling back to polling every {poll_interval} s")
+    if watcher is None:
+        watcher = PollingWatcher(repos, poll_interval)
+        print(f"Polling {len(repos)} repositories every {poll_interval} s...")
+
+    # {repo: time of last change}
+    dirty = {}
+    try:
+        while True:
+            timeout = max(0., min(dirty.values())+debounce-time.monotonic()) if dirty else None
+            for repo in watcher.wait(debounce if timeout is None else timeout):
+                dirty[repo] = time.monotonic()
+            now = time.monotonic()
+            due = sorted((repo for repo, t in dirty.items() if now-t >= debounce), key=repos.index)
+            if due:
+                for repo in due:
+                    del dirty[repo]
+                print(time.strftime("%Y-%m-%d %H:%M:%S"), f"pushing {str(due)[1:-1]}")
+                results, _ = process_repos(True, due, jobs, flag_force)
+                print("\n".join(format_report(results)))
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+        if dirty:
+            print(f"Repositories changed but not pushed: {str(sorted(dirty, key=repos.index))[1:-1]}")
+
+
+def process_repos(flag_push, repos, jobs=1, flag_force=False):
+    """Runs push_pull_1() on repositories in a pool of jobs threads, printing each output as it finishes.
+
+    Returns:
+        (results, wall_time)
+    """
+    t0 = time.perf_counter()
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(push_pull_1, flag_push, repo, flag_force) for repo in repos]
+        for future in concurrent.futures.as_completed(futures):
+            result, output = future.result()
+            print(output, flush=True)
+            results.append(result)
+    return results, time.perf_counter()-t0
+
+
 def gitaux_main(flag_push, flag_simulation=False):
     f"""
     Pushes or pulls repositories listed in file '{FN}' (does NOT recurse into subdirectories).
 
+    Repositories are processed by a pool of "-j" worker threads; the output of each repository is
+    printed as one block when it finishes. Repositories with nothing to do are skipped unless "-f"
+    (see push_pull_1()). At the end, a table with the results is printed, slowest repository first
+    ("--report" also saves it as JSON). Exits with status 1 if any repository failed.
+
+    pushall.py "--watch" then keeps pushing repositories as they change (see watch_repos()).
+
     Args:
         flag_push: whether to push or pull .
         flag_simulation: if set, will just print repository name and will have no effect.
     """
     global MSG, PWD
 
+    parser = argparse.ArgumentParser(description=f"{'Pushes' if flag_push else 'Pulls'} repositories listed in '{FN}'")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of repositories processed concurrently")
+    parser.add_argument("-x", "--exclude", action="append", default=[], metavar="PATTERN",
+                        help=f"Glob pattern of directory names to skip when looking for repositories "
+                             f"(may be repeated; added to {DEFAULT_EXCLUDES}). Directories containing "
+                             f"'.git' are never skipped")
+    parser.add_argument("-X", "--no-default-excludes", action="store_true",
+                        help="Uses only the patterns given with -x, not the default ones")
+    parser.add_argument("-s", "--submodules", action="store_true",
+                        help="Also looks for repositories inside repositories (submodules, nested clones)")
+    parser.add_argument("-r", "--rescan", action="store_true",
+                        help="Ignores repository index (kept in '{}') and scans all directories again".format(DIR_INDEX))
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="Runs git on every repository, even those that seem to have nothing to "
+                             f"{'push' if flag_push else 'pull'}")
+    parser.add_argument("--report", metavar="FILENAME",
+                        help="Saves per-repository results (timing, git exit codes, transfer) as JSON")
+    if flag_push:
+        parser.add_argument("-w", "--watch", action="store_true",
+                            help="After pushing, keeps running and pushes repositories as they change")
+        parser.add_argument("--debounce", type=float, default=10., metavar="SECONDS",
+                            help="(--watch) Time without further changes before a repository is pushed")
+        parser.add_argument("--poll", action="store_true",
+                            help="(--watch) Polls 'git status' instead of using inotify")
+        parser.add_argument("--poll-interval", type=float, default=10., metavar="SECONDS",
+                            help="(--watch) Polling interval")
+        parser.add_argument("message", nargs=argparse.REMAINDER, help="Commit message")
+    args = parser.parse_args()
+
     if flag_push:
-        if len(sys.argv) < 2:
+        if not args.message:
             print("Please specify a commit message as one or more command-line arguments.")
             sys.exit()
         else:
-            MSG = " ".join(sys.argv[1:])
+            MSG = " ".join(args.message)
 
     PWD = os.getcwd()
-    repos = get_repos()
-    for repo in repos:
-        if flag_simulation:
+    excludes = ([] if args.no_default_excludes else DEFAULT_EXCLUDES)+args.exclude
+    repos = get_repos(excludes, args.submodules, not args.rescan)
+    if flag_simulation:
+        for repo in repos:
             print(f"{'pushing' if flag_push else 'pulling'} '{repo}'")
-        else:
-            push_pull_1(flag_push, repo)
+        return
+
+    results, wall_time = process_repos(flag_push, repos, args.jobs, args.force)
+
+    print()
+    print("\n".join(format_report(results)))
+    print(f"Total wall time: {wall_time:.2f} s")
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump({"command": "push" if flag_push else "pull", "jobs": args.jobs, "time": wall_time,
+                       "repos": sorted(results, key=lambda r: r["time"], reverse=True)}, file, indent=2)
+        print(f"Report saved as '{args.report}'")
+
+    num_skipped = sum(r["status"] == "skipped" for r in results)
+    failed = [r["repo"] for r in results if r["status"] == "failed"]
+    if num_skipped:
+        print(f"{num_skipped} of {len(repos)} repositor{'ies' if len(repos) != 1 else 'y'} skipped (nothing to do)")
+    if failed:
+        failed.sort(key=repos.index)
+        print(f"{len(failed)} of {len(repos)} repositor{'ies' if len(repos) != 1 else 'y'} failed: {str(failed)[1:-1]}")
+
+    if flag_push and args.watch:
+        watch_repos(repos, excludes, args.debounce, args.jobs, args.force, args.poll,
+                    args.poll_interval)
+    elif failed:
+        sys.exit(1)
@@ -1,5 +1,6 @@
 """Shared console helpers for aleatools scripts."""
 
+import os
 import sys
 
 
@@ -33,3 +34,28 @@ class ConsoleHelper(object):
 def make_console(script_name):
     """Return a ConsoleHelper configured with the given script name prefix."""
     return ConsoleHelper(script_name)
+
+
+def is_part_file(fn):
+    """Return whether fn is a temporary output, named "<name>.part<extension>"."""
+    return os.path.splitext(os.path.splitext(fn)[0])[1] == ".part"
+
+
+def drop_outputs(filenames, output_directory, prefixes):
+    """Return filenames without the outputs and temporary files of previous runs.
+
+    Outputs are saved as os.path.join(output_directory, prefix+input filename).
+    A file is taken for an output only if the input it would have been made
+    from is also in filenames, or exists; names that merely start with a
+    prefix are kept."""
+    inputs = {os.path.normpath(fn) for fn in filenames}
+    ret = []
+    for fn in filenames:
+        if is_part_file(fn):
+            continue
+        rel = os.path.relpath(fn, output_directory)
+        sources = [rel[len(prefix):] for prefix in prefixes if prefix and rel.startswith(prefix)]
+        if any(os.path.normpath(source) in inputs or os.path.isfile(source) for source in sources):
+            continue
+        ret.append(fn)
+    return ret
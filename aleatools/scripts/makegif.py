@@ -1,26 +1,342 @@
 #!/usr/bin/env python
 """
-Makes animated gif with all '.png' files in current directory
+Makes animated gif with all image files (in alphabetical order) in current directory
+
+Outputs of previous runs ("movie-NNNN.<format>") and files that Pillow cannot open are left out.
+
+Alternatively ("--format"), frames can be piped into 'ffmpeg' to make MP4, WebM or animated WebP.
 """
 import glob
-import imageio
+import os
+import re
+import sys
+import shutil
+import struct
+import subprocess
 import argparse
+import collections
+import concurrent.futures
 import a107
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+
+def frame_filenames(filenames, flag_backwardsbind=False):
+    """Yields filenames in frame order.
+
+    With flag_backwardsbind, frames are then repeated backwards (last to second) to bind end of loop with
+    beginning. The backwards segment is yielded as filenames too, so frames are decoded again rather than
+    kept in memory.
+    """
+    yield from filenames
+    if flag_backwardsbind:
+        yield from filenames[:0:-1]
+
+
+def image_filenames(filenames, output_prefix="movie"):
+    """Returns filenames that Pillow can open as images, except outputs of previous runs
+    ("<output_prefix>-NNNN.<format>")."""
+    formats = ["gif"]+list(FfmpegStreamWriter.FORMATS)
+    re_output = re.compile(r"^{}-\d+\.({})$".format(re.escape(output_prefix), "|".join(formats)))
+    ret = []
+    for filename in filenames:
+        if re_output.match(os.path.basename(filename)) or not os.path.isfile(filename):
+            continue
+        try:
+            # only reads the header
+            with Image.open(filename):
+                pass
+        except OSError:  # includes PIL.UnidentifiedImageError
+            continue
+        ret.append(filename)
+    return ret
+
+
+def parse_size(s):
+    """Parses "WxH", "W" or "xH" into (width, height) tuple, with None for the missing dimension."""
+    w, _, h = s.partition("x")
+    return (int(w) if w else None), (int(h) if h else None)
+
+
+def target_size(size, fit=None, scale=None):
+    """Returns (width, height) that size (width, height) has to be reduced to, or None to keep it.
+
+    Args:
+        fit: (width, height) box the image must fit in, keeping aspect ratio (either may be None)
+        scale: scale factor
+    """
+    w, h = size
+    factor = 1.
+    if fit is not None:
+        factor = min(fit[0]/w if fit[0] else 1., fit[1]/h if fit[1] else 1.)
+    if scale is not None:
+        factor = min(factor, scale)
+    if factor >= 1.:
+        return None
+    return max(1, round(w*factor)), max(1, round(h*factor))
+
+
+def load_frame(filename, fit=None, scale=None):
+    """Decodes image file as (height, width, 3) uint8 array, optionally downscaled (see target_size()).
+
+    When downscaling, JPEG files are decoded at reduced resolution (Image.draft(), DCT scaling) and
+    Image.reduce() takes the image to within 2x of the target before the final Lanczos resize.
+    """
+    im = Image.open(filename)
+    target = None if fit is None and scale is None else target_size(im.size, fit, scale)
+    if target is not None:
+        im.draft("RGB", target)
+        im = im.convert("RGB")
+        factor = min(im.width//target[0], im.height//target[1])
+        if factor >= 2:
+            im = im.reduce(factor)
+        if im.size != target:
+            im = im.resize(target, Image.LANCZOS)
+    return to_rgb(im.convert("RGB"))
+
+
+def iter_frames(filenames, fit=None, scale=None, jobs=1):
+    """Decodes frames (see load_frame()) in order, using a pool of jobs threads.
+
+    At most 2*jobs frames are decoded ahead of the consumer.
+    """
+    if jobs <= 1:
+        for filename in filenames:
+            yield load_frame(filename, fit, scale)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        queue = collections.deque()
+        for filename in filenames:
+            queue.append(executor.submit(load_frame, filename, fit, scale))
+            if len(queue) >= 2*jobs:
+                yield queue.popleft().result()
+        while queue:
+            yield queue.popleft().result()
+
+
+def to_rgb(image):
+    """Returns image as (height, width, 3) uint8 array (grayscale is expanded, alpha is dropped)."""
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = np.stack([image]*3, axis=-1)
+    return np.ascontiguousarray(image[..., :3], dtype=np.uint8)
+
+
+def median_cut(pixels, num_colors):
+    """Computes palette of up to num_colors colors from (n, 3) uint8 array of pixels.
+
+    The box with largest (channel range)*(number of pixels) is split at the median of its widest channel,
+    until there are num_colors boxes; colors are the box means.
+    """
+    def score(box):
+        return int((box.max(0).astype(int)-box.min(0)).max())*len(box)
+
+    boxes = [pixels]
+    scores = [score(pixels)]
+    while len(boxes) < num_colors:
+        i = int(np.argmax(scores))
+        if scores[i] == 0:
+            break
+        box = boxes.pop(i)
+        del scores[i]
+        channel = int(np.argmax(box.max(0).astype(int)-box.min(0)))
+        half = len(box)//2
+        order = np.argpartition(box[:, channel], half)
+        for part in (box[order[:half]], box[order[half:]]):
+            boxes.append(part)
+            scores.append(score(part))
+    return np.array([box.mean(0) for box in boxes]).round().astype(np.uint8)
+
+
+def compute_palette(filenames, num_frames=16, max_pixels=500000, num_colors=255, **kwargs):
+    """Computes global palette from up to num_frames frames evenly spaced in filenames.
+
+    Frames are subsampled so that at most max_pixels pixels in total go into median_cut(). kwargs are
+    passed to iter_frames().
+    """
+    step = max(1, len(filenames)//num_frames)
+    samples = [image.reshape(-1, 3) for image in iter_frames(filenames[::step][:num_frames], **kwargs)]
+    stride = max(1, sum(len(x) for x in samples)//max_pixels)
+    return median_cut(np.concatenate([x[::stride] for x in samples]), num_colors)
+
+
+class GifStreamWriter(object):
+    """Writes animated GIF frame by frame, using one global palette.
+
+    Only the bounding rectangle of the pixels that changed since the previous frame is stored, with
+    unchanged pixels inside the rectangle set to transparent; frames identical to the previous one are
+    merged into it by adding up their durations. LZW compression is done by Pillow.
+
+    Args:
+        filename: output filename
+        palette: (n, 3) uint8 array with n <= 255 (index 255 is reserved for transparency)
+        duration: frame duration in milliseconds
+    """
+
+    TRANSPARENT = 255
+
+    def __init__(self, filename, palette, duration):
+        self.duration = duration
+        self.palette = np.zeros((256, 3), np.uint8)
+        self.palette[:len(palette)] = palette
+        self.lut = self._make_lut(palette)
+        self.file = open(filename, "wb")
+        self.canvas = None
+        # (image, offset, duration) waiting to be written, as the next frame may extend its duration
+        self.pending = None
+        self.num_frames = 0
+
+    @staticmethod
+    def _make_lut(palette):
+        """Maps every 15-bit color (5 bits per channel) to the index of the nearest palette color."""
+        centers = (np.arange(32, dtype=np.float32)*8+4)
+        grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1).reshape(-1, 3)
+        palette = palette.astype(np.float32)
+        distances = (palette**2).sum(1)[None, :]-2*grid@palette.T
+        return distances.argmin(1).astype(np.uint8)
+
+    def _quantize(self, rgb):
+        rgb = rgb >> 3
+        return self.lut[(rgb[..., 0].astype(np.uint16) << 10) | (rgb[..., 1].astype(np.uint16) << 5) | rgb[..., 2]]
+
+    def _write_header(self, width, height):
+        self.file.write(b"GIF89a"+struct.pack("<HHBBB", width, height, 0xF7, 0, 0))
+        self.file.write(self.palette.tobytes())
+        # loops forever
+        self.file.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01"+struct.pack("<H", 0)+b"\x00")
+
+    def _flush(self):
+        if self.pending is not None:
+            indexes, offset, duration = self.pending
+            im = Image.fromarray(indexes, "P")
+            for chunk in GifImagePlugin.getdata(im, offset, duration=duration, disposal=1,
+                                                transparency=self.TRANSPARENT):
+                self.file.write(chunk)
+            self.pending = None
+            self.num_frames += 1
+
+    def append(self, image):
+        indexes = self._quantize(to_rgb(image))
+        if self.canvas is None:
+            self._write_header(indexes.shape[1], indexes.shape[0])
+            self.pending = (indexes, (0, 0), self.duration)
+        else:
+            if indexes.shape != self.canvas.shape:
+                raise ValueError(f"Frame size {indexes.shape[::-1]} differs from first frame's {self.canvas.shape[::-1]}")
+            changed = indexes != self.canvas
+            rows, cols = np.flatnonzero(changed.any(1)), np.flatnonzero(changed.any(0))
+            if not len(rows):
+                self.pending = self.pending[:2]+(self.pending[2]+self.duration,)
+            else:
+                self._flush()
+                y0, y1, x0, x1 = rows[0], rows[-1]+1, cols[0], cols[-1]+1
+                delta = np.where(changed[y0:y1, x0:x1], indexes[y0:y1, x0:x1], self.TRANSPARENT).astype(np.uint8)
+                self.pending = (delta, (int(x0), int(y0)), self.duration)
+        self.canvas = indexes
+
+    def close(self):
+        self._flush()
+        self.file.write(b"\x3B")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FfmpegStreamWriter(object):
+    """Pipes raw RGB frames into an 'ffmpeg' process, which encodes them as a video or animated WebP.
+
+    Has the same interface as GifStreamWriter (append(), close()); all frames must have the size of the
+    first one.
+
+    Args:
+        filename: output filename
+        duration: frame duration in milliseconds
+        fmt: key of FORMATS
+    """
+
+    # {format: codec options}
+    FORMATS = {
+        # yuv420p is needed for most players and requires even dimensions
+        "mp4": ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", "23", "-movflags", "+faststart",
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"],
+        "webm": ["-c:v", "libvpx-vp9", "-pix_fmt", "yuv420p", "-crf", "32", "-b:v", "0",
+                 "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"],
+        "webp": ["-c:v", "libwebp", "-loop", "0", "-q:v", "75"],
+    }
+
+    def __init__(self, filename, duration, fmt):
+        self.filename = filename
+        self.duration = duration
+        self.fmt = fmt
+        self.process = None
+        self.shape = None
+
+    def append(self, image):
+        image = to_rgb(image)
+        if self.process is None:
+            self.shape = image.shape
+            cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                   "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{image.shape[1]}x{image.shape[0]}",
+                   "-framerate", f"1000/{self.duration}", "-i", "-"]+self.FORMATS[self.fmt]+[self.filename]
+            self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        elif image.shape != self.shape:
+            raise ValueError(f"Frame size {image.shape[1::-1]} differs from first frame's {self.shape[1::-1]}")
+        try:
+            self.process.stdin.write(image.tobytes())
+        except BrokenPipeError:
+            self.close()
+            raise RuntimeError("'ffmpeg' stopped reading frames")
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        code = self.process.wait()
+        self.process = None
+        if code != 0:
+            raise RuntimeError(f"'ffmpeg' exited with code {code}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=a107.SmartFormatter)
     parser.add_argument("-d", "--duration", default=100, type=int, help="Frame duration in miliseconds")
     parser.add_argument("-b", "--backwardsbind", action="store_true", help="Repeats frames backwards to bind end of loop with beginning")
+    parser.add_argument("-p", "--palette-sample", default=16, type=int, help="Number of frames sampled to compute the global palette")
+    parser.add_argument("--size", type=parse_size, help="Maximum frame size, e.g. '640x480', '640' or 'x480' (keeps aspect ratio)")
+    parser.add_argument("--scale", type=float, help="Scale factor applied to frames, e.g. 0.25")
+    parser.add_argument("-j", "--jobs", default=os.cpu_count() or 1, type=int, help="Number of frames decoded in parallel")
+    parser.add_argument("-f", "--format", default="gif", choices=["gif"]+list(FfmpegStreamWriter.FORMATS),
+                        help="Output format; all but 'gif' are encoded by 'ffmpeg'")
     args = parser.parse_args()
-    filenames = glob.glob("*")
-    filenames.sort()
-    images = []
-    allimages = [imageio.imread(filename) for filename in filenames]
-    for image in allimages:
-        images.append(image)
-    if args.backwardsbind:
-        for image in allimages[:0:-1]:
-            images.append(image)
-    outputfilename = a107.new_filename("movie", "gif")
-    imageio.mimsave(outputfilename, images, duration=args.duration/1000)
+    if args.format != "gif" and shutil.which("ffmpeg") is None:
+        print("'ffmpeg' command not found, bye.")
+        sys.exit()
+    filenames = image_filenames(sorted(glob.glob("*")))
+    if not filenames:
+        print("No image files found, bye.")
+        sys.exit()
+    outputfilename = a107.new_filename("movie", args.format)
+    frame_kwargs = {"fit": args.size, "scale": args.scale, "jobs": args.jobs}
+    if args.format == "gif":
+        palette = compute_palette(filenames, args.palette_sample, **frame_kwargs)
+        writer = GifStreamWriter(outputfilename, palette, args.duration)
+    else:
+        writer = FfmpegStreamWriter(outputfilename, args.duration, args.format)
+    # Frames are appended to the file as they come, so only a few frames are held in memory
+    with writer:
+        for image in iter_frames(frame_filenames(filenames, args.backwardsbind), **frame_kwargs):
+            writer.append(image)
     print(f"Saved '{outputfilename}")
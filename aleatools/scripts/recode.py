@@ -4,16 +4,38 @@
 Output files are saved as "<input filename>.<encoding>", e.g.,
  "text.txt" --> "text.txt.windows-1252".
 
+Several output encodings may be given separated by commas, e.g.,
+'-t windows-1252,latin-1,ascii'. Each input file is then read and decoded
+once, and the text is passed on to one encoder per output.
+
 List of input filenames (wildcards allowed) will be glob'ed and
 duplicates will be removed.
 
-Files ending with <to> will be skipped as they will be considered
+Files ending with any of <to> will be skipped as they will be considered
 outputs of a previous run.
 
+Files are streamed through incremental codecs in blocks of BUFSIZE bytes,
+so memory use does not depend on file size.
+
+Files are recoded by a pool of processes ('-j'). Whether to overwrite
+existing outputs is asked for all files before recoding starts.
+
+Outputs that recoding would leave unchanged are copied instead (in kernel
+space where possible): pure ASCII files between two ASCII-compatible
+encodings (e.g. UTF-8 and windows-1252), and valid files when <from> and
+<to> are the same encoding.
+
 """
 
+import codecs
+import concurrent.futures
+import contextlib
+import functools
 import glob
+import importlib
 import argparse
+import mmap
+import shutil
 import sys
 import os
 import a107
@@ -23,6 +45,8 @@ from _cli_common import make_console
 
 DEFAULT_FROM = "utf-8"
 DEFAULT_TO = "windows-1252"
+# Block size for reading/writing files
+BUFSIZE = 4*1024*1024
 
 
 console = make_console("recode")
@@ -43,42 +67,212 @@ def recode(bytes_, from_=DEFAULT_FROM, to=DEFAULT_TO):
     return text.encode(to, "xmlcharrefreplace")
 
 
-def get_filenames(patterns, to):
+def recode_stream(f, targets, from_=DEFAULT_FROM, bufsize=BUFSIZE):
+    """Reads binary file object f to the end and writes it, recoded as in
+    recode(), into each of targets, a list of (binary file object, encoding).
+
+    Each block is decoded once and the text is passed on to one encoder per
+    target. Incremental codecs carry multibyte sequences split between
+    blocks over to the next block, so the result is the same as
+    recode(f.read()).
+    """
+
+    decoder = codecs.getincrementaldecoder(from_)("replace")
+    encoders = [(g, codecs.getincrementalencoder(to)("xmlcharrefreplace")) for g, to in targets]
+    while True:
+        block = f.read(bufsize)
+        final = not block
+        text = decoder.decode(block, final)
+        for g, encoder in encoders:
+            g.write(encoder.encode(text, final))
+        if final:
+            break
+
+
+@functools.lru_cache()
+def is_ascii_compatible(encoding):
+    """Returns whether encoding decodes and encodes ASCII characters as
+    the same single bytes, without a BOM or shift sequences."""
+
+    # all ASCII characters, then shift sequences of ISO-2022, HZ and UTF-7
+    probes = [bytes(range(128)), b"\x1b$B!!\x1b(B", b"~{!!~}", b"+AGE-"]
+    try:
+        return all(probe.decode(encoding) == probe.decode("ascii") and
+                   probe.decode("ascii").encode(encoding) == probe for probe in probes)
+    except (UnicodeError, LookupError):
+        return False
+
+
+@functools.lru_cache()
+def is_round_trip(encoding):
+    """Returns whether decoding valid input and encoding it again with the
+    same encoding gives back the same bytes. True for UTF-8, ASCII,
+    latin-1 and the single-byte codecs based on a decoding table
+    (windows-125x, ISO-8859-x etc.)."""
+
+    name = codecs.lookup(encoding).name
+    if name in ("utf-8", "ascii", "iso8859-1"):
+        return True
+    try:
+        return hasattr(importlib.import_module("encodings."+name.replace("-", "_")), "decoding_table")
+    except ImportError:
+        return False
+
+
+def is_ascii_file(fn, bufsize=BUFSIZE):
+    """Returns whether file fn contains only ASCII bytes (checked on a
+    memory map, bufsize bytes at a time)."""
+
+    with open(fn, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return True
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return all(m[i:i+bufsize].isascii() for i in range(0, len(m), bufsize))
+
+
+def is_valid_file(fn, encoding, bufsize=BUFSIZE):
+    """Returns whether file fn decodes without errors in encoding."""
+
+    decoder = codecs.getincrementaldecoder(encoding)("strict")
+    try:
+        with open(fn, "rb", buffering=0) as f:
+            while True:
+                block = f.read(bufsize)
+                decoder.decode(block, not block)
+                if not block:
+                    return True
+    except UnicodeDecodeError:
+        return False
+
+
+def is_unchanged(fn, from_, tos):
+    """Returns list with, for each encoding in tos, whether recoding file fn
+    into it would give the same bytes. The file is scanned at most once
+    for ASCII."""
+
+    ret, ascii_file = [], None
+    for to in tos:
+        if not (is_ascii_compatible(from_) and is_ascii_compatible(to)):
+            ret.append(False)
+            continue
+        if ascii_file is None:
+            ascii_file = is_ascii_file(fn)
+        ret.append(ascii_file or codecs.lookup(from_).name == codecs.lookup(to).name and
+                   is_round_trip(from_) and is_valid_file(fn, from_))
+    return ret
+
+
+def copy_file(fn, fn_out):
+    """Copies file fn into fn_out, in kernel space using copy_file_range()
+    or sendfile() if available, else through a user space buffer."""
+
+    with open(fn, "rb") as f, open(fn_out, "wb") as g:
+        size, offset = os.fstat(f.fileno()).st_size, 0
+        try:
+            while offset < size:
+                if hasattr(os, "copy_file_range"):
+                    n = os.copy_file_range(f.fileno(), g.fileno(), size-offset, offset, offset)
+                else:
+                    n = os.sendfile(g.fileno(), f.fileno(), offset, size-offset)
+                if n == 0:
+                    break
+                offset += n
+        except (OSError, AttributeError):
+            # e.g. copy across file systems on older kernels, or no sendfile() on this platform
+            pass
+        f.seek(offset)
+        g.seek(offset)
+        g.truncate()
+        shutil.copyfileobj(f, g, BUFSIZE)
+
+
+def recode_file(fn, targets, from_=DEFAULT_FROM):
+    """Recodes file fn into each of targets, a list of (output filename,
+    encoding), reading and decoding fn once (see recode_stream()).
+
+    Outputs that would come out unchanged (see is_unchanged()) are copied."""
+
+    unchanged = is_unchanged(fn, from_, [to for _, to in targets])
+    for (fn_out, _), flag in zip(targets, unchanged):
+        if flag:
+            copy_file(fn, fn_out)
+    targets = [target for target, flag in zip(targets, unchanged) if not flag]
+    if not targets:
+        return
+    with contextlib.ExitStack() as stack:
+        f = stack.enter_context(open(fn, "rb", buffering=0))
+        recode_stream(f, [(stack.enter_context(open(fn_out, "wb", buffering=0)), to) for fn_out, to in targets],
+                      from_)
+
+
+def get_filenames(patterns, tos):
     """Compile list of file names.
 
     Each item in patterns list may have wildcards, and these will be expanded
-    into actual filenames, then duplicates will be removed."""
+    into actual filenames, then duplicates will be removed. Files ending with
+    any of the encodings in tos are left out."""
 
-    _ff = []
+    ff, seen, tos = [], set(), tuple(tos)
     for pattern in patterns:
-        _ff.extend(glob.glob(pattern))
-    ff = []
-    for f in _ff:
-        if f not in ff and not f.endswith(to):
-            ff.append(f)
+        for f in glob.glob(pattern):
+            if f not in seen and not f.endswith(tos):
+                seen.add(f)
+                ff.append(f)
 
     return ff
 
 
-def do_it(filenames, from_, to):
+def get_pairs(filenames, tos):
+    """Returns list of (input filename, targets), targets being a list of
+    (output filename, encoding), asking whether to overwrite each existing
+    output; outputs not to be overwritten are left out, and so are files
+    left with no outputs."""
+
+    pairs = []
     for fn in filenames:
-        write0("'{}' ...".format(fn))
-        try:
+        targets = []
+        for to in tos:
             fn_out = "{}.{}".format(fn, to)
             if os.path.exists(fn_out):
                 if not a107.yesno("ATTENTION: File '{}' already exists. Overwrite it?".format(fn_out), default=True):
-                    write1(" skipped overwrite.\n")
+                    write0("'{}' skipped overwrite.\n".format(fn_out))
                     continue
-            with open(fn, 'rb') as f:
-                bytes_ = f.read()
-                bytes_out = recode(bytes_, from_, to)
-                with open(fn_out, "wb") as g:
-                    g.write(bytes_out)
-                    write1("\b\b\b--> '{}' OK =D\n".format(fn_out))
+            targets.append((fn_out, to))
+        if targets:
+            pairs.append((fn, targets))
+    return pairs
+
+
+def _recode_file_safe(fn, targets, from_):
+    """Calls recode_file(); returns None or error message (the exception is logged)."""
+
+    try:
+        recode_file(fn, targets, from_)
+    except Exception as e:
+        a107.get_python_logger().exception("Error recoding file '{}'".format(fn))
+        return str(e)
 
-        except Exception as e:
-            write1("Oops :( {} ):\n".format(str(e)))
-            a107.get_python_logger().exception("Error recoding file '{}'".format(fn))
+
+def do_it(filenames, from_, tos, jobs=1):
+    pairs = get_pairs(filenames, tos)
+    if jobs <= 1 or len(pairs) <= 1:
+        results = (_recode_file_safe(fn, targets, from_) for fn, targets in pairs)
+        _report(pairs, results)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            args = list(zip(*pairs))
+            n = len(pairs)
+            results = executor.map(_recode_file_safe, args[0], args[1], [from_]*n,
+                                   chunksize=max(1, n//(jobs*16)))
+            _report(pairs, results)
+
+
+def _report(pairs, results):
+    for (fn, targets), error in zip(pairs, results):
+        if error is None:
+            write0("'{}' --> {} OK =D\n".format(fn, ", ".join("'{}'".format(fn_out) for fn_out, _ in targets)))
+        else:
+            write0("'{}' Oops :( {} ):\n".format(fn, error))
 
 
 if __name__ == "__main__":
@@ -86,13 +280,22 @@ if __name__ == "__main__":
     parser.add_argument('-f', '--from', type=str, default=DEFAULT_FROM, required=False,
         help='encoding (supposed) of input file(s)', )
     parser.add_argument('-t', '--to', default=DEFAULT_TO, required=False, type=str,
-        help='output encoding', )
+        help="output encoding(s), separated by commas, e.g. 'windows-1252,latin-1,ascii'", )
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='number of files recoded in parallel', )
     parser.add_argument('inputs', type=str, nargs='+',
      help='input filenames (wildcards allowed)')
 
     args = parser.parse_args()
 
-    filenames = get_filenames(args.inputs, args.to)
+    tos = list(dict.fromkeys(to.strip() for to in args.to.split(",") if to.strip()))
+    for to in tos:
+        try:
+            codecs.lookup(to)
+        except LookupError:
+            parser.error("unknown encoding: '{}'".format(to))
+
+    filenames = get_filenames(args.inputs, tos)
 
     wormsay0("hi")
 
@@ -101,7 +304,7 @@ if __name__ == "__main__":
     write0("\n")
 
     args_ = vars(args)
-    do_it(filenames, args_["from"], args_["to"])
+    do_it(filenames, args_["from"], tos, args.jobs)
 
     line = "bye"
     wormsay1(line)
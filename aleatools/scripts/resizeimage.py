@@ -1,28 +1,87 @@
 #!/usr/bin/env python
 
 """
-This is a very specific script to resize image to 64x64 pixels. I don't remember what was the initial goal.
+Converts images to grayscale + alpha ("LA") and resizes them to 64x64 pixels (see '--size').
+
+Palette images are converted using two 256-entry lookup tables built once per image: gray level of
+each palette color, and its alpha from the 'transparency' info (PNG tRNS chunk). Both are applied to
+the color indexes with Image.point(), i.e., in C. Other images are just converted by Pillow.
+
+Usage:
+  resizeimage.py input output
+  resizeimage.py -o OUTPUT_DIRECTORY files...   (batch mode, files may use wildcards)
 
 Taken from
 http://stackoverflow.com/questions/14634014/resizing-png-image-with-pil-loses-transparency
 """
 
+import argparse
+import glob
+import os
 import sys
+import a107
 from PIL import Image
 
-img = Image.open(sys.argv[1])
-pal = img.getpalette()
-width, height = img.size
-actual_transp = img.info['actual_transparency'] # XXX This will fail.
 
-result = Image.new('LA', img.size)
+def parse_size(s):
+    """'WxH' or 'N' (square) --> (W, H)."""
+    w, _, h = s.lower().partition("x")
+    return int(w), int(h or w)
+
+
+def la_luts(img):
+    """Returns (gray, alpha) lookup tables (256 entries each) for palette image."""
+    pal = (img.getpalette() or [])[:768]
+    pal += [0]*(768-len(pal))
+    # Same weights as Image.convert("L")
+    gray = [(r*299+g*587+b*114)//1000 for r, g, b in zip(pal[0::3], pal[1::3], pal[2::3])]
+    alpha = [255]*256
+    transparency = img.info.get("transparency")
+    if isinstance(transparency, bytes):
+        alpha[:len(transparency)] = transparency
+    elif isinstance(transparency, int):
+        alpha[transparency] = 0
+    return gray, alpha
+
+
+def to_la(img):
+    """Converts image to "LA" mode."""
+    if img.mode != "P":
+        return img.convert("LA")
+    gray, alpha = la_luts(img)
+    # color indexes as a "L" image, so that point() maps them through the tables
+    index = Image.frombytes("L", img.size, img.tobytes())
+    return Image.merge("LA", (index.point(gray), index.point(alpha)))
+
+
+def resize_image(fn, fno, size):
+    with Image.open(fn) as img:
+        to_la(img).resize(size, Image.LANCZOS).save(fno)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=a107.SmartFormatter)
+    parser.add_argument('files', nargs='+', help="Input and output files; or input files if '-o' is given")
+    parser.add_argument('-o', '--output-directory', help='Batch mode: converts all files into this directory, keeping their names')
+    parser.add_argument('-s', '--size', type=parse_size, default=(64, 64), help="Output size, 'WxH' or 'N' (NxN)")
+    args = parser.parse_args()
 
-im = img.load()
-res = result.load()
-for x in range(width):
-    for y in range(height):
-        t = actual_transp[im[x, y]]
-        color = pal[im[x, y]]
-        res[x, y] = (color, t)
+    if args.output_directory is None:
+        if len(args.files) != 2:
+            parser.error("Specify input and output files, or '-o OUTPUT_DIRECTORY'")
+        pairs = [tuple(args.files)]
+    else:
+        fns = [fn for pattern in args.files for fn in sorted(glob.glob(pattern))]
+        pairs = [(fn, os.path.join(args.output_directory, os.path.basename(fn))) for fn in fns]
 
-result.resize((64, 64), Image.ANTIALIAS).save(sys.argv[2])
+    num_errors = 0
+    for fn, fno in pairs:
+        try:
+            resize_image(fn, fno, args.size)
+        except Exception as e:
+            print(f"Error converting '{fn}': {e}", file=sys.stderr)
+            num_errors += 1
+        else:
+            if len(pairs) > 1:
+                print(f"Saved '{fno}'")
+    sys.exit(1 if num_errors else 0)
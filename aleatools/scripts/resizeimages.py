@@ -1,15 +1,45 @@
 #!/usr/bin/env python
 """Resize images.
 
-Resizes images specified with wildcards using the 'convert' command."""
+Resizes images specified with wildcards, in-process using Pillow, or using the 'convert' command.
+
+Pillow understands the common geometries of 'convert': 'WxH' (fit inside, keeping aspect ratio),
+'W', 'xH', 'P%', 'P%xQ%', and the '!' (ignore aspect ratio), '>' (only shrink) and '<' (only enlarge)
+flags. Other geometries, and animated images, are handed over to 'convert'.
+
+When shrinking by 2x or more, Pillow decodes JPEG files at reduced resolution (DCT scaling) and
+reduces the image by an integer factor to within 2x of the target, before the final resampling pass;
+'--exact' disables this shortcut.
+
+Outputs are written under a temporary name and renamed when complete. With '--incremental', files whose
+output is up to date are skipped, so an interrupted batch can be resumed by running it again. Up to date
+means: the manifest saved in the output directory records the same source (size and mtime, or else
+content hash) and settings, and the output was not changed since; or, for outputs not in the manifest,
+the output is newer than the source. The manifest is only read, written (and sources hashed) with
+'--incremental'.
+
+More outputs can be made from the same files with '--also GEOMETRY PREFIX' (may be repeated). Each
+file is decoded once, and each output is resized from the smallest larger output already made."""
 
 import glob
 import os
 import os.path
+import re
+import json
+import hashlib
 import argparse
 import a107
 import shutil
+import subprocess
 import sys
+import concurrent.futures
+
+from _cli_common import drop_outputs
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 RED = '\033[0;31m'
 PURPLE = '\033[0;35m'
@@ -17,6 +47,13 @@ GREEN = '\033[0;32m'
 BLUE = '\033[0;34m'
 NC = '\033[0m' # No Color
 
+FN_MANIFEST = ".resizeimages-manifest.json"
+
+RESAMPLE = ["nearest", "bilinear", "bicubic", "lanczos"]
+
+_GEOMETRY_RE = re.compile(r"^(\d+(?:\.\d+)?%?)?(?:x(\d+(?:\.\d+)?%?))?([!<>]?)$")
+
+
 # https://stackoverflow.com/questions/11210104/check-if-a-program-exists-from-a-python-script
 def is_tool(name):
     """Check whether `name` is on PATH and marked as executable."""
@@ -29,37 +66,304 @@ def is_tool(name):
 def pprint(*args):
     print("{}resizeimages.py{}:".format(PURPLE, NC), *args)
 
+
+def parse_geometry(geometry):
+    """Parses 'convert' geometry. Returns (width, height, flag_percent, flag) or raises ValueError.
+
+    width/height may be None (not specified); flag is one of "", "!", "<", ">".
+    """
+    m = _GEOMETRY_RE.match(geometry.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        raise ValueError(f"Geometry '{geometry}' not supported by Pillow engine")
+    w, h, flag = m.groups()
+    flag_percent = "%" in geometry
+    if flag_percent and w is None:
+        raise ValueError(f"Geometry '{geometry}' not supported by Pillow engine")
+    w, h = [None if x is None else float(x.rstrip("%")) for x in (w, h)]
+    if flag_percent and h is None:
+        h = w
+    return w, h, flag_percent, flag
+
+
+def new_size(size, geometry):
+    """Calculates size (width, height) of image after resize, the way 'convert' does.
+
+    Args:
+        size: (width, height) of original image
+        geometry: as returned by parse_geometry()
+    """
+    W, H = size
+    w, h, flag_percent, flag = geometry
+    if flag_percent:
+        ret = W*w/100, H*h/100
+    elif flag == "!" and w is not None and h is not None:
+        ret = w, h
+    else:
+        factor = min(w/W if w is not None else float("inf"), h/H if h is not None else float("inf"))
+        ret = W*factor, H*factor
+    ret = max(1, round(ret[0])), max(1, round(ret[1]))
+    if (flag == ">" and ret[0] >= W and ret[1] >= H) or (flag == "<" and ret[0] <= W and ret[1] <= H):
+        return W, H
+    return ret
+
+
+def resize_pillow(fn, outputs, options):
+    """Resizes image file fn into one or more files using Pillow, decoding it only once.
+
+    Outputs are made largest first, each resized from the smallest already resized image that is at least
+    as large (or from the original image).
+
+    Args:
+        outputs: list of (geometry, output filename), geometry as returned by parse_geometry()
+        options: {"quality": JPEG quality, "resample": one of RESAMPLE, "exact": disables shortcut for
+                 large reductions (see module docstring)}
+
+    Returns:
+        False if fn must be handed over to 'convert', True otherwise
+    """
+    with Image.open(fn) as im:
+        if getattr(im, "n_frames", 1) > 1:
+            return False
+        sizes = [new_size(im.size, geometry) for geometry, _ in outputs]
+        params = {k: im.info[k] for k in ("exif", "icc_profile", "dpi") if k in im.info}
+        maxw, maxh = max(w for w, _ in sizes), max(h for _, h in sizes)
+        flag_fast = not options["exact"] and maxw*2 <= im.size[0] and maxh*2 <= im.size[1]
+        if flag_fast:
+            # JPEG only: decoded at the smallest scale that is still at least twice the largest target size
+            im.draft(im.mode, (maxw*2, maxh*2))
+        if im.mode in ("P", "1", "LA", "I;16"):
+            im = im.convert("RGBA" if "transparency" in im.info or im.mode == "LA" else "RGB")
+        resample = getattr(Image, options["resample"].upper())
+
+        made = [im]
+        for size, (_, fno) in sorted(zip(sizes, outputs), key=lambda x: x[0][0]*x[0][1], reverse=True):
+            source = min((x for x in made if x.size[0] >= size[0] and x.size[1] >= size[1]),
+                         key=lambda x: x.size[0]*x.size[1], default=im)
+            out = source
+            if size != source.size:
+                flag_gap = flag_fast and size[0]*2 <= source.size[0] and size[1]*2 <= source.size[1]
+                # reducing_gap: Image.reduce() by integer factor to within 2x of size, then resample
+                out = source.resize(size, resample, reducing_gap=2.0 if flag_gap else None)
+                made.append(out)
+            _params = dict(params)
+            if os.path.splitext(fno)[1].lower() in (".jpg", ".jpeg", ".jpe"):
+                if out.mode not in ("RGB", "L", "CMYK"):
+                    out = out.convert("RGB")
+                _params["quality"] = options["quality"]
+            out.save(fno, **_params)
+    return True
+
+
+def resize_convert(fn, outputs):
+    """Resizes image file fn into one or more files using a single 'convert' call. Returns exit code.
+
+    Args:
+        outputs: list of (geometry, output filename)
+    """
+    cmd = ["convert", fn]
+    for geometry, fno in outputs[:-1]:
+        cmd += ["(", "+clone", "-resize", geometry, "-write", fno, "+delete", ")"]
+    cmd += ["-resize", outputs[-1][0], outputs[-1][1]]
+    return subprocess.run(cmd).returncode
+
+
+def file_hash(fn):
+    """Returns SHA-1 hex digest of file contents."""
+    h = hashlib.sha1()
+    with open(fn, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def is_up_to_date(fn, fno, settings, record):
+    """Tells whether output fno is up to date with source fn.
+
+    Args:
+        settings: dict of settings that affect the output (geometry etc.)
+        record: manifest record of fno (see resize_one()), or None
+
+    Returns:
+        (flag_up_to_date, record): record may have been refreshed (source touched, but same content)
+    """
+    try:
+        st, sto = os.stat(fn), os.stat(fno)
+    except OSError:
+        return False, record
+    if record is None:
+        return sto.st_size > 0 and sto.st_mtime_ns >= st.st_mtime_ns, None
+    if record["settings"] != settings or record["output"] != [sto.st_size, sto.st_mtime_ns]:
+        return False, record
+    if record["source"] == [st.st_size, st.st_mtime_ns]:
+        return True, record
+    if record["source"][0] == st.st_size and record["hash"] == file_hash(fn):
+        return True, dict(record, source=[st.st_size, st.st_mtime_ns])
+    return False, record
+
+
+def resize_one(fn, outputs, engine, options, incremental=False, records=None):
+    """Resizes fn into one or more outputs; runs in the worker processes.
+
+    Each output is written as "<output without extension>.part<extension>", then renamed.
+
+    Args:
+        outputs: list of (geometry, output filename)
+        options: Pillow options, see resize_pillow()
+        incremental: if set, outputs that are up to date are not made again (see is_up_to_date())
+        records: list of manifest records of outputs from a previous run (None for outputs not in manifest)
+
+    Returns:
+        (fn, results): results has one (fno, error, skipped, record) per output: error is None on success,
+        or an error message; record is the new manifest record (None if not incremental, or on error):
+        {"source": [size, mtime_ns], "hash", "settings", "output": [size, mtime_ns]}
+    """
+    if records is None:
+        records = [None]*len(outputs)
+    settings = [dict(options, geometry=geometry, engine=engine) for geometry, _ in outputs]
+    results = [None]*len(outputs)
+    if incremental:
+        for i, ((_, fno), record) in enumerate(zip(outputs, records)):
+            try:
+                flag_up_to_date, record = is_up_to_date(fn, fno, settings[i], record)
+            except Exception:
+                flag_up_to_date = False
+            if flag_up_to_date:
+                results[i] = (fno, None, True, record)
+    todo = [i for i, result in enumerate(results) if result is None]
+    if not todo:
+        return fn, results
+
+    try:
+        st = os.stat(fn)
+        temps = []
+        for i in todo:
+            root, ext = os.path.splitext(outputs[i][1])
+            temps.append(f"{root}.part{ext}")
+        if not (engine == "pillow" and
+                resize_pillow(fn, [(parse_geometry(outputs[i][0]), fnt) for i, fnt in zip(todo, temps)], options)):
+            if not is_tool("convert"):
+                raise RuntimeError("'convert' command not found")
+            res = resize_convert(fn, [(outputs[i][0], fnt) for i, fnt in zip(todo, temps)])
+            if res != 0:
+                raise RuntimeError(f"'convert' exit code {res}")
+        # Hashing means reading the source again, so only done when the manifest is going to be used
+        hash_ = file_hash(fn) if incremental else None
+        for i, fnt in zip(todo, temps):
+            fno = outputs[i][1]
+            os.replace(fnt, fno)
+            record = None
+            if incremental:
+                sto = os.stat(fno)
+                record = {"source": [st.st_size, st.st_mtime_ns], "hash": hash_, "settings": settings[i],
+                          "output": [sto.st_size, sto.st_mtime_ns]}
+            results[i] = (fno, None, False, record)
+    except Exception as e:
+        error = str(e) if isinstance(e, RuntimeError) else f"{e.__class__.__name__}: {e}"
+        for i in todo:
+            if results[i] is None:
+                results[i] = (outputs[i][1], error, False, None)
+    return fn, results
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, FN_MANIFEST), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(directory, manifest):
+    fn = os.path.join(directory, FN_MANIFEST)
+    with open(fn+".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(fn+".tmp", fn)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=__doc__,  formatter_class=a107.SmartFormatter)
     parser.add_argument('-d', '--delete-after', action="store_true", help="Deletes each file after it has been successfully converted")
     parser.add_argument('-o', '--output-directory', default='.', help='Output directory')
+    parser.add_argument('-e', '--engine', choices=["auto", "pillow", "convert"], default="auto",
+                        help="'auto' uses Pillow if installed and if it understands the geometry, 'convert' otherwise")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='Number of files processed in parallel')
+    parser.add_argument('-q', '--quality', type=int, default=92, help='JPEG quality (Pillow engine)')
+    parser.add_argument('-r', '--resample', choices=RESAMPLE, default="lanczos", help='Resampling filter (Pillow engine)')
+    parser.add_argument('--exact', action="store_true", help='Always decodes at full resolution and resamples in one pass (Pillow engine)')
+    parser.add_argument('-i', '--incremental', action="store_true", help="Skips files whose output is up to date")
     parser.add_argument('files', type=str, help='Files specified with wildcards')
     parser.add_argument('geometry', type=str, help="New geometry as interpreted by 'convert'")
     parser.add_argument('prefix', nargs='?', type=str, default='resized-', help='Prefix to be added at the beginning of the output files')
+    parser.add_argument('-a', '--also', nargs=2, action="append", default=[], metavar=("GEOMETRY", "PREFIX"),
+                        help="Also makes outputs with this geometry and prefix, from the same decoded image (may be repeated)")
 
     args = parser.parse_args()
 
-    if not is_tool('convert'):
+    # [(geometry, prefix), ...]
+    pairs = [(args.geometry, args.prefix)]+[tuple(x) for x in args.also]
+
+    engine = args.engine
+    if engine != "convert":
+        try:
+            for geometry, _ in pairs:
+                parse_geometry(geometry)
+            if Image is None:
+                raise ValueError("Pillow not installed")
+            engine = "pillow"
+        except ValueError as e:
+            if engine == "pillow":
+                pprint(f"{RED}{e}, bye.{NC}")
+                sys.exit()
+            engine = "convert"
+
+    if engine == "convert" and not is_tool('convert'):
         pprint("'convert' command not found, bye.")
         sys.exit()
 
-    prefix = args.prefix
     # I think this behaviour is not necessary; rather limiting and confusing
     # if not prefix.endswith(("-", "_")):
     #     prefix += "-"
     #     pprint("'-' appended to prefix")
 
-    a = glob.glob(args.files)
+    a = drop_outputs(glob.glob(args.files), args.output_directory, [p for _, p in pairs])
     pprint("Number of files: ", len(a))
-    for fn in a:
-        fno = os.path.join(args.output_directory, prefix+fn)
-        pprint("{}Processing file '{}'...{}".format(BLUE, fn, NC))
-        res = os.system("convert \"{}\" -resize {} \"{}\"".format(fn, args.geometry, fno))
-        pprint("{}Error {}{}".format(RED, res, NC) if res != 0 else "{}Saved '{}'.{}".format(GREEN, fno, NC))
-        if res == 0 and args.delete_after:
-            try:
-                os.unlink(fn)
-            except Exception as e:
-                pprint(f"{RED}Error deleting file '{fn}': '{str(e)}'{NC}")
-            else:
-                pprint(f"{GREEN}File '{fn}' was deleted{NC}")
+    pprint(f"Engine: {engine}; jobs: {args.jobs}")
+    # {output filename relative to output directory: record}, see resize_one(); only with --incremental
+    manifest = load_manifest(args.output_directory) if args.incremental else {}
+    options = {"quality": args.quality, "resample": args.resample, "exact": args.exact}
+    num_skipped = 0
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+            futures = []
+            for fn in a:
+                outputs = [(geometry, os.path.join(args.output_directory, prefix+fn)) for geometry, prefix in pairs]
+                records = [manifest.get(os.path.relpath(fno, args.output_directory)) for _, fno in outputs]
+                futures.append(executor.submit(resize_one, fn, outputs, engine, options, args.incremental, records))
+
+            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                fn, results = future.result()
+                flag_ok = True
+                for fno, error, skipped, record in results:
+                    if record is not None:
+                        manifest[os.path.relpath(fno, args.output_directory)] = record
+                    if skipped:
+                        num_skipped += 1
+                        continue
+                    flag_ok = flag_ok and error is None
+                    pprint("{}Error processing '{}': {}{}".format(RED, fn, error, NC) if error is not None else "{}Saved '{}'.{}".format(GREEN, fno, NC))
+                if all(x[2] for x in results):
+                    continue
+                if flag_ok and args.delete_after:
+                    try:
+                        os.unlink(fn)
+                    except Exception as e:
+                        pprint(f"{RED}Error deleting file '{fn}': '{str(e)}'{NC}")
+                    else:
+                        pprint(f"{GREEN}File '{fn}' was deleted{NC}")
+                if args.incremental and i % 100 == 99:
+                    save_manifest(args.output_directory, manifest)
+    finally:
+        if args.incremental:
+            save_manifest(args.output_directory, manifest)
+    if num_skipped:
+        pprint(f"{num_skipped} output{'s' if num_skipped != 1 else ''} up to date, skipped")
@@ -1,15 +1,41 @@
 #!/usr/bin/env python
 """Resizes videos re-encoding using x265
 
-Resizes videos specified with wildcards using the 'ffmpeg' command."""
+Resizes videos specified with wildcards using the 'ffmpeg' command.
+
+Several files are encoded at the same time ('-j'); the CPU cores are divided among the running
+encodes ('-threads'), and longest videos are started first so that the batch finishes sooner.
+
+Progress of each encode (fps, speed, ETA) is shown together with the ETA of the whole batch. At the
+end, a JSON summary with sizes and wall times is written (see '--summary').
+
+Each output is written under a temporary name and renamed only after ffmpeg succeeds and (if 'ffprobe'
+is available) its duration matches the input's. Running the same command again skips the files whose
+outputs are complete, so an interrupted batch can be resumed.
+
+For long videos, '--segments N' splits each input at keyframes into N pieces (without re-encoding),
+encodes the pieces in parallel and joins the results with the concat demuxer. Files are then processed
+one at a time, each using all cores.
+
+More sizes can be made from the same files with '--also GEOMETRY PREFIX' (may be repeated). All sizes
+come out of a single ffmpeg run per file, which decodes the input once and feeds a 'split' filter with
+one scaler per size."""
 
 import glob
+import json
 import os
 import os.path
 import argparse
 import a107
 import shutil
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+import concurrent.futures
+
+from _cli_common import drop_outputs
 
 RED = '\033[0;31m'
 PURPLE = '\033[0;35m'
@@ -26,16 +52,300 @@ def is_tool(name):
 
     return which(name) is not None
 
+_print_lock = threading.Lock()
+
 def pprint(*args):
-    print("{}resizeimages.py{}:".format(PURPLE, NC), *args)
+    with _print_lock:
+        print("{}resizevideos.py{}:".format(PURPLE, NC), *args)
+
+
+def probe_duration(fn):
+    """Returns duration of video in seconds according to 'ffprobe', or 0. if it cannot be found out."""
+    try:
+        proc = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration",
+                               "-of", "default=noprint_wrappers=1:nokey=1", fn],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+        return float(proc.stdout.decode().strip())
+    except (OSError, ValueError):
+        return 0.
+
+
+def format_time(seconds):
+    """Formats seconds as 'H:MM:SS', or '?' if None."""
+    if seconds is None:
+        return "?"
+    seconds = int(round(seconds))
+    return "{}:{:02}:{:02}".format(seconds//3600, seconds//60%60, seconds%60)
+
+
+def _to_float(value):
+    """Converts ffmpeg progress value (e.g. '23.9', '1.52x', 'N/A') to float, or None."""
+    try:
+        return float(value.rstrip("x"))
+    except (AttributeError, ValueError):
+        return None
+
+
+class Progress(object):
+    """Collects ffmpeg '-progress' reports from the running encodes and prints fps, speed and ETAs.
+
+    The batch ETA is the media time still to be encoded (all files) divided by the sum of the speeds
+    of the encodes currently running.
+
+    Args:
+        durations: {filename: duration in seconds}; files of unknown duration have no ETA
+        interval: minimum number of seconds between two lines printed for the same file
+    """
+
+    def __init__(self, durations, interval=5.):
+        self.lock = threading.Lock()
+        self.durations = durations
+        self.interval = interval
+        self.done = {}
+        self.speeds = {}
+        self.last_print = {}
+
+    def batch_eta(self):
+        total_speed = sum(self.speeds.values())
+        if total_speed <= 0 or not self.durations:
+            return None
+        remaining = sum(max(0., duration-self.done.get(fn, 0.)) for fn, duration in self.durations.items())
+        return remaining/total_speed
+
+    def update(self, fn, report):
+        """Call with each block of key=value pairs reported by ffmpeg."""
+        out_time_us = _to_float(report.get("out_time_us"))
+        speed = _to_float(report.get("speed"))
+        fps = _to_float(report.get("fps"))
+        with self.lock:
+            if out_time_us is not None:
+                self.done[fn] = out_time_us/1e6
+            if speed is not None:
+                self.speeds[fn] = speed
+            now = time.monotonic()
+            if now-self.last_print.get(fn, 0.) < self.interval:
+                return
+            self.last_print[fn] = now
+            duration = self.durations.get(fn)
+            eta = None
+            if duration and speed:
+                eta = max(0., duration-self.done.get(fn, 0.))/speed
+            pprint("{}{}{}: {} fps, speed {}x, ETA {}; batch ETA {}".format(
+                BLUE, fn, NC, "?" if fps is None else "{:.1f}".format(fps),
+                "?" if speed is None else "{:.2f}".format(speed), format_time(eta),
+                format_time(self.batch_eta())))
+
+    def finish(self, fn):
+        with self.lock:
+            self.speeds.pop(fn, None)
+            self.done[fn] = self.durations.get(fn, 0.)
+
+
+def part_filename(fno):
+    """Temporary name for output being encoded, e.g. 'resized-a.mp4' --> 'resized-a.part.mp4'.
+
+    The extension is kept last so that ffmpeg still infers the container from it."""
+    root, ext = os.path.splitext(fno)
+    return root+".part"+ext
+
+
+def verify_output(fno, duration):
+    """Returns whether fno exists and its duration (by 'ffprobe') matches duration within 1% or 1 second."""
+    if not duration or not os.path.isfile(fno):
+        return False
+    return abs(probe_duration(fno)-duration) <= max(1., duration*0.01)
+
+
+def encode(fn, outputs, threads, crf=26, progress=None, duration=None):
+    """Runs 'ffmpeg' to re-encode fn into each of outputs, a list of (geometry, fno). Returns ffmpeg exit
+    code, or first non-zero code returned by finish_output().
+
+    The input is decoded once; with several outputs, the 'split' filter feeds one scaler per geometry
+    and the threads are shared among the encoders.
+
+    ffmpeg writes to temporary files which are renamed on success (see finish_output()).
+
+    ffmpeg progress reports are passed on to progress.update(), if progress is given."""
+    fnps = [part_filename(fno) for _, fno in outputs]
+    cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-nostats", "-progress", "pipe:1", "-y",
+           "-i", fn]
+    if len(outputs) == 1:
+        cmd += ["-crf", str(crf), "-s:v", outputs[0][0], "-threads", str(threads), fnps[0]]
+    else:
+        n = len(outputs)
+        graph = "[0:v]split={}{};".format(n, "".join(f"[v{i}]" for i in range(n)))+\
+                ";".join(f"[v{i}]scale=s={geometry}[o{i}]" for i, (geometry, _) in enumerate(outputs))
+        cmd += ["-filter_complex", graph]
+        for i, fnp in enumerate(fnps):
+            cmd += ["-map", f"[o{i}]", "-map", "0:a?", "-crf", str(crf), "-threads", str(max(1, threads//n)), fnp]
+    # cmd = ["ffmpeg", "-i", fn, "-vcodec", "libx265", "-crf", "28", "-s:v", geometry, fno]
+    pprint(" ".join(cmd))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    report = {}
+    for line in proc.stdout:
+        key, _, value = line.strip().partition("=")
+        report[key] = value
+        if key == "progress":
+            if progress is not None:
+                progress.update(fn, report)
+            report = {}
+    returncode = proc.wait()
+    if progress is not None:
+        progress.finish(fn)
+    return finish_outputs(fnps, outputs, returncode, duration)
+
+
+def finish_output(fnp, fno, returncode, duration=None):
+    """Renames temporary output fnp to fno if returncode is 0 and its duration checks. Returns returncode,
+    or 1 if the duration check failed."""
+    if returncode == 0 and duration and not verify_output(fnp, duration):
+        pprint(f"{RED}'{fnp}' is {probe_duration(fnp):.1f} seconds long, expected {duration:.1f}{NC}")
+        returncode = 1
+    if returncode == 0:
+        os.replace(fnp, fno)
+    else:
+        try:
+            os.unlink(fnp)
+        except OSError:
+            pass
+    return returncode
+
+
+def finish_outputs(fnps, outputs, returncode, duration=None):
+    """Calls finish_output() for each temporary file in fnps and (geometry, fno) in outputs. Returns
+    first non-zero code, or 0."""
+    codes = [finish_output(fnp, fno, returncode, duration) for fnp, (_, fno) in zip(fnps, outputs)]
+    return next((code for code in codes if code != 0), 0)
+
+
+def delete_file(fn):
+    try:
+        os.unlink(fn)
+    except Exception as e:
+        pprint(f"{RED}Error deleting file '{fn}': '{str(e)}'{NC}")
+    else:
+        pprint(f"{GREEN}File '{fn}' was deleted{NC}")
+
+
+def timed(func, fn, outputs, *args, **kwargs):
+    """Calls func(fn, outputs, *args, **kwargs). Returns (fn, outputs, result, wall time)."""
+    t = time.monotonic()
+    res = func(fn, outputs, *args, **kwargs)
+    return fn, outputs, res, time.monotonic()-t
+
+
+def file_size(fn):
+    try:
+        return os.path.getsize(fn)
+    except OSError:
+        return None
+
+
+class Scheduler(object):
+    """Divides CPU cores among concurrent encodes.
+
+    Each encode gets cores/n threads when it starts, n being the number of encodes that can run from then
+    on, i.e., at most num_jobs but fewer as the queue empties.
+    """
+
+    def __init__(self, num_files, num_jobs, num_cores):
+        self.lock = threading.Lock()
+        self.num_waiting = num_files
+        self.num_running = 0
+        self.num_jobs = num_jobs
+        self.num_cores = num_cores
+
+    def start(self):
+        """Call when an encode starts. Returns number of threads for it."""
+        with self.lock:
+            self.num_waiting -= 1
+            self.num_running += 1
+            return max(1, self.num_cores//min(self.num_jobs, self.num_running+self.num_waiting))
+
+    def finish(self):
+        with self.lock:
+            self.num_running -= 1
+
+    def run(self, fn, outputs, **kwargs):
+        """Encodes fn into outputs (see encode()). Returns (fn, outputs, exit code, wall time)."""
+        threads = self.start()
+        try:
+            return timed(encode, fn, outputs, threads, **kwargs)
+        finally:
+            self.finish()
+
+
+def encode_segmented(fn, outputs, num_segments, num_cores, crf=26, duration=None):
+    """Encodes fn into outputs (see encode()) as num_segments pieces encoded in parallel. Returns exit code.
+
+    The first video stream of the input is cut with the 'segment' muxer and '-c copy', so cuts fall on
+    keyframes and pieces may have slightly different lengths. Other streams (data tracks etc.) are left
+    out, as they often cannot be muxed into segments. Encoded pieces are joined with the 'concat' demuxer,
+    also with '-c copy', and the audio is copied once from the input into the joined file, so that there
+    are no gaps at the joins. Temporary files go to a hidden directory next to first output, removed at
+    the end.
+    """
+    fnps = [part_filename(fno) for _, fno in outputs]
+    ext = os.path.splitext(fn)[1]
+    tmpdir = tempfile.mkdtemp(prefix=".resizevideos-", dir=os.path.dirname(outputs[0][1]) or ".")
+    try:
+        cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-i", fn, "-map", "0:v:0", "-c", "copy",
+               "-f", "segment", "-segment_time", "{:.3f}".format(duration/num_segments), "-reset_timestamps", "1",
+               os.path.join(tmpdir, "in%04d"+ext)]
+        pprint(" ".join(cmd))
+        returncode = subprocess.run(cmd).returncode
+        if returncode != 0:
+            return returncode
+
+        segments = sorted(glob.glob(os.path.join(tmpdir, "in*"+ext)))
+        pprint(f"'{fn}' split into {len(segments)} segment{'s' if len(segments) != 1 else ''}")
+        progress = Progress({seg: probe_duration(seg) for seg in segments})
+        scheduler = Scheduler(len(segments), len(segments), num_cores)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            futures = [executor.submit(scheduler.run, seg,
+                                       [(geometry, os.path.join(tmpdir, f"out{i}-"+os.path.basename(seg)[2:]))
+                                        for i, (geometry, _) in enumerate(outputs)],
+                                       crf=crf, progress=progress) for seg in segments]
+            results = [future.result() for future in futures]
+        for seg, _, res, _ in results:
+            if res != 0:
+                pprint(f"{RED}Error {res} encoding segment '{seg}'{NC}")
+                return res
+
+        codes = []
+        for i, (output, fnp) in enumerate(zip(outputs, fnps)):
+            fn_list = os.path.join(tmpdir, f"concat{i}.txt")
+            with open(fn_list, "w") as f:
+                for _, outputs_seg, _, _ in results:
+                    f.write("file '{}'\n".format(os.path.basename(outputs_seg[i][1]).replace("'", "'\\''")))
+            cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                   "-i", fn_list, "-i", fn, "-map", "0:v", "-map", "1:a?", "-c", "copy", "-y", fnp]
+            pprint(" ".join(cmd))
+            codes.append(finish_outputs([fnp], [output], subprocess.run(cmd).returncode, duration))
+        return next((code for code in codes if code != 0), 0)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
 
 if __name__ == "__main__":
+    num_cores = os.cpu_count() or 1
     parser = argparse.ArgumentParser(description=__doc__,  formatter_class=a107.SmartFormatter)
-    parser.add_argument('-d', '--delete-after', action="store_true", help="Deletes each file after it has been successfully converted")
+    parser.add_argument('-d', '--delete-after', action="store_true", help="Deletes each file after it has been successfully converted (or found to be already converted)")
     parser.add_argument('-o', '--output-directory', default='.', help='Output directory')
+    parser.add_argument('-j', '--jobs', type=int, default=max(1, num_cores//4), help='Number of files encoded at the same time')
+    parser.add_argument('-c', '--crf', type=int, default=26, help='Constant rate factor passed to ffmpeg (lower is better quality)')
+    parser.add_argument('-n', '--segments', type=int, default=1,
+                        help="R|Splits each file into this many segments at keyframes and encodes them\n"
+                             "in parallel (files are then encoded one at a time). Needs 'ffprobe'")
+    parser.add_argument('-s', '--summary', default=None,
+                        help="R|JSON summary file (input/output bytes, ratio=output/input, wall time\n"
+                             "per file). Defaults to '.resizevideos-summary.json' in output directory\n"
+                             "(a dotfile, so that '*' does not take it as input)")
     parser.add_argument('files', type=str, help='Files specified with wildcards')
     parser.add_argument('geometry', type=str, help="New geometry, e.g. '720x405', '1024x576' etc.")
     parser.add_argument('prefix', nargs='?', type=str, default='resized-', help='Prefix to be added at the beginning of the output files')
+    parser.add_argument('-a', '--also', nargs=2, action="append", default=[], metavar=("GEOMETRY", "PREFIX"),
+                        help="Also makes outputs of this geometry with this prefix, in the same ffmpeg run (may be repeated)")
 
     args = parser.parse_args()
 
@@ -44,27 +354,89 @@ if __name__ == "__main__":
         sys.exit()
 
     prefix = args.prefix
+    pairs = [(args.geometry, prefix)]+[tuple(x) for x in args.also]
     # I think this behaviour is not necessary; rather limiting and confusing
     # if not prefix.endswith(("-", "_")):
     #     prefix += "-"
     #     pprint("'-' appended to prefix")
 
-    a = glob.glob(args.files)
+    a = drop_outputs(glob.glob(args.files), args.output_directory, [p for _, p in pairs])
     pprint("Number of files: ", len(a))
+    durations = {}
+    if is_tool('ffprobe'):
+        durations = {fn: probe_duration(fn) for fn in a}
+        # longest first
+        a.sort(key=lambda fn: durations[fn], reverse=True)
+
+    # Skips files whose outputs were completed by a previous run; otherwise encodes only missing outputs
+    todo, num_skipped = [], 0
     for fn in a:
-        fno = os.path.join(args.output_directory, prefix+fn)
-        pprint("{}Processing file '{}'...{}".format(BLUE, fn, NC))
-
-        line = f"ffmpeg -i {fn} -crf 26 -s:v {args.geometry} {fno}"
-        # line = f"ffmpeg -i {fn} -vcodec libx265 -crf 28 -s:v {args.geometry} {fno}"
-        pprint(line)
-        res = os.system(line)
-        # res = 0
-        pprint("{}Error {}{}".format(RED, res, NC) if res != 0 else "{}Saved '{}'.{}".format(GREEN, fno, NC))
-        if res == 0 and args.delete_after:
-            try:
-                os.unlink(fn)
-            except Exception as e:
-                pprint(f"{RED}Error deleting file '{fn}': '{str(e)}'{NC}")
+        outputs = [(geometry, os.path.join(args.output_directory, prefix_+fn)) for geometry, prefix_ in pairs]
+        outputs = [(geometry, fno) for geometry, fno in outputs if not verify_output(fno, durations.get(fn))]
+        if not outputs:
+            pprint(f"Skipping '{fn}': output{'s' if len(pairs) != 1 else ''} already done")
+            num_skipped += 1
+            if args.delete_after:
+                delete_file(fn)
+        else:
+            todo.append((fn, outputs))
+
+    progress = Progress({fn: durations[fn] for fn, _ in todo if durations.get(fn, 0.) > 0})
+    input_sizes = {fn: file_size(fn) for fn, _ in todo}
+    num_jobs = max(1, min(args.jobs, len(todo)))
+    # Files encoded in segments (those of known duration)
+    segmented = set()
+    if args.segments > 1:
+        if not durations:
+            pprint(f"{RED}'--segments' needs 'ffprobe', encoding files whole{NC}")
+        else:
+            segmented = {fn for fn, _ in todo if durations[fn] > 0}
+            num_jobs = 1
+    pprint(f"Encoding {num_jobs} file{'s' if num_jobs != 1 else ''} at a time, {num_cores} cores")
+
+    scheduler = Scheduler(len(todo)-len(segmented), num_jobs, num_cores)
+    records = []
+    t_batch = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_jobs) as executor:
+        futures = []
+        for fn, outputs in todo:
+            if fn in segmented:
+                futures.append(executor.submit(timed, encode_segmented, fn, outputs, args.segments,
+                                               num_cores, crf=args.crf, duration=durations[fn]))
             else:
-                pprint(f"{GREEN}File '{fn}' was deleted{NC}")
+                futures.append(executor.submit(scheduler.run, fn, outputs, crf=args.crf, progress=progress,
+                                               duration=durations.get(fn)))
+
+        for future in concurrent.futures.as_completed(futures):
+            fn, outputs, res, wall_time = future.result()
+            input_bytes = input_sizes[fn]
+            record = {"input": fn, "returncode": res, "duration": durations.get(fn), "wall_time": round(wall_time, 3),
+                      "input_bytes": input_bytes, "outputs": []}
+            for geometry, fno in outputs:
+                output_bytes = file_size(fno) if res == 0 else None
+                record["outputs"].append({"geometry": geometry, "output": fno, "output_bytes": output_bytes,
+                                          "ratio": output_bytes/input_bytes if input_bytes and output_bytes is not None else None})
+            records.append(record)
+            if res != 0:
+                pprint("{}Error {} encoding '{}'{}".format(RED, res, fn, NC))
+            else:
+                for _, fno in outputs:
+                    pprint("{}Saved '{}'.{}".format(GREEN, fno, NC))
+            if res == 0 and args.delete_after:
+                delete_file(fn)
+
+    ok = [r for r in records if r["returncode"] == 0]
+    input_bytes = sum(r["input_bytes"] or 0 for r in ok)
+    output_bytes = sum(o["output_bytes"] or 0 for r in ok for o in r["outputs"])
+    summary = {"renditions": [{"geometry": geometry, "prefix": prefix_} for geometry, prefix_ in pairs], "crf": args.crf, "segments": args.segments, "jobs": num_jobs, "cores": num_cores,
+               "wall_time": round(time.monotonic()-t_batch, 3), "num_files": len(records), "num_errors": len(records)-len(ok),
+               "num_skipped": num_skipped,
+               "input_bytes": input_bytes, "output_bytes": output_bytes,
+               "ratio": output_bytes/input_bytes if input_bytes else None, "files": records}
+    fn_summary = args.summary if args.summary is not None else os.path.join(args.output_directory, ".resizevideos-summary.json")
+    if todo:
+        with open(fn_summary, "w") as f:
+            json.dump(summary, f, indent=2)
+        pprint("{} -> {} bytes (ratio {}), wall time {}; summary saved as '{}'".format(
+            input_bytes, output_bytes, "?" if summary["ratio"] is None else "{:.3f}".format(summary["ratio"]),
+            format_time(summary["wall_time"]), fn_summary))
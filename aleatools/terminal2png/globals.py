@@ -1,6 +1,9 @@
 """
 global configuration of the project
 
+Values that depend on the environment or on the filesystem are attributes of SETTINGS, resolved
+on first read (they remain accessible as module attributes, e.g. globals.WWO_KEY).
+
 External environment variables:
 
     WTTR_MYDIR
@@ -16,43 +19,171 @@ from __future__ import print_function
 import logging
 import os
 import re
+from functools import cached_property
+
+
+def _read_key(filename):
+    "Returns stripped contents of key file `filename`, or None if it does not exist"
+
+    if os.path.exists(filename):
+        with open(filename, 'r') as f:
+            return f.read().strip()
+    return None
+
+
+class Settings(object):
+    """
+    Lazily-evaluated configuration.
+
+    Each value is resolved from the environment (and, for API keys, from disk) the first time
+    it is read, then cached. Importing this module therefore does no filesystem I/O.
+    """
+
+    @cached_property
+    def HOME(self):
+        # expanduser() falls back to the password database when $HOME is not set
+        return os.environ.get("HOME") or os.path.expanduser("~")
+
+    @cached_property
+    def MYDIR(self):
+        return os.path.abspath(os.path.dirname(os.path.dirname('__file__')))
+
+    @cached_property
+    def GEOLITE(self):
+        return os.environ.get("WTTR_GEOLITE", os.path.join(self.MYDIR, 'data', "GeoLite2-City.mmdb"))
+
+    @cached_property
+    def WEGO(self):
+        return os.environ.get("WTTR_WEGO", "/home/igor/go/bin/we-lang")
+
+    PYPHOON = "pyphoon-lolcat"
+
+    _DATADIR = "/wttr.in"
+    _LOGDIR = "/wttr.in/log"
+
+    @cached_property
+    def IP2LCACHE(self):
+        return os.path.join(self._DATADIR, "cache/ip2l/")
+
+    @cached_property
+    def PNG_CACHE(self):
+        return os.path.join(self._DATADIR, "cache/png")
+
+    @cached_property
+    def LRU_CACHE(self):
+        return os.path.join(self._DATADIR, "cache/lru")
+
+    @cached_property
+    def LOG_FILE(self):
+        return os.path.join(self._LOGDIR, 'main.log')
+
+    @cached_property
+    def PROXY_LOG_ACCESS(self):
+        return os.path.join(self._LOGDIR, 'proxy-access.log')
+
+    @cached_property
+    def PROXY_LOG_ERRORS(self):
+        return os.path.join(self._LOGDIR, 'proxy-errors.log')
 
-MYDIR = os.path.abspath(os.path.dirname(os.path.dirname('__file__')))
+    @cached_property
+    def MISSING_TRANSLATION_LOG(self):
+        return os.path.join(self._LOGDIR, 'missing-translation/%s.log')
 
-if "WTTR_GEOLITE" in os.environ:
-    GEOLITE = os.environ["WTTR_GEOLITE"]
-else:
-    GEOLITE = os.path.join(MYDIR, 'data', "GeoLite2-City.mmdb")
+    @cached_property
+    def ALIASES(self):
+        return os.path.join(self.MYDIR, "share/aliases")
 
-WEGO = os.environ.get("WTTR_WEGO", "/home/igor/go/bin/we-lang")
-PYPHOON = "pyphoon-lolcat"
+    @cached_property
+    def ANSI2HTML(self):
+        return os.path.join(self.MYDIR, "share/ansi2html.sh")
 
-_DATADIR = "/wttr.in"
-_LOGDIR = "/wttr.in/log"
+    @cached_property
+    def BLACKLIST(self):
+        return os.path.join(self.MYDIR, "share/blacklist")
 
-IP2LCACHE = os.path.join(_DATADIR, "cache/ip2l/")
-PNG_CACHE = os.path.join(_DATADIR, "cache/png")
-LRU_CACHE = os.path.join(_DATADIR, "cache/lru")
+    @cached_property
+    def HELP_FILE(self):
+        return os.path.join(self.MYDIR, 'share/help.txt')
 
-LOG_FILE = os.path.join(_LOGDIR, 'main.log')
+    @cached_property
+    def BASH_FUNCTION_FILE(self):
+        return os.path.join(self.MYDIR, 'share/bash-function.txt')
 
-PROXY_LOG_ACCESS = os.path.join(_LOGDIR, 'proxy-access.log')
-PROXY_LOG_ERRORS = os.path.join(_LOGDIR, 'proxy-errors.log')
+    @cached_property
+    def TRANSLATION_FILE(self):
+        return os.path.join(self.MYDIR, 'share/translation.txt')
 
-MISSING_TRANSLATION_LOG = os.path.join(_LOGDIR, 'missing-translation/%s.log')
+    @cached_property
+    def IATA_CODES_FILE(self):
+        return os.path.join(self.MYDIR, 'share/list-of-iata-codes.txt')
 
-ALIASES = os.path.join(MYDIR, "share/aliases")
-ANSI2HTML = os.path.join(MYDIR, "share/ansi2html.sh")
-BLACKLIST = os.path.join(MYDIR, "share/blacklist")
+    @cached_property
+    def TEMPLATES(self):
+        return os.path.join(self.MYDIR, 'share/templates')
 
-HELP_FILE = os.path.join(MYDIR, 'share/help.txt')
-BASH_FUNCTION_FILE = os.path.join(MYDIR, 'share/bash-function.txt')
-TRANSLATION_FILE = os.path.join(MYDIR, 'share/translation.txt')
+    @cached_property
+    def STATIC(self):
+        return os.path.join(self.MYDIR, 'share/static')
 
-IATA_CODES_FILE = os.path.join(MYDIR, 'share/list-of-iata-codes.txt')
+    @cached_property
+    def LISTEN_HOST(self):
+        return os.environ.get("WTTR_LISTEN_HOST", "")
+
+    @cached_property
+    def LISTEN_PORT(self):
+        try:
+            return int(os.environ.get("WTTR_LISTEN_PORT"))
+        except (TypeError, ValueError):
+            return 8002
+
+    @cached_property
+    def PROXY_CACHEDIR(self):
+        return os.path.join(self._DATADIR, "cache/proxy-wwo/")
+
+    @cached_property
+    def IPLOCATION_ORDER(self):
+        return os.environ.get("WTTR_IPLOCATION_ORDER", 'geoip,ip2location,ipinfo').split(',')
+
+    @cached_property
+    def IP2LOCATION_KEY(self):
+        return _read_key(os.environ.get(
+            "WTTR_IP2LOCATION_KEY_FILE",
+            os.path.join(self.HOME, '.ip2location.key')))
+
+    @cached_property
+    def IPINFO_TOKEN(self):
+        return _read_key(os.environ.get(
+            "WTTR_IPINFO_KEY_FILE",
+            os.path.join(self.HOME, '.ipinfo.key')))
+
+    @cached_property
+    def _WWO_KEY(self):
+        return _read_key(os.environ.get(
+            "WTTR_WWO_KEY_FILE",
+            os.path.join(self.HOME, '.wwo.key')))
+
+    @cached_property
+    def WWO_KEY(self):
+        return self._WWO_KEY if self._WWO_KEY is not None else "key-is-not-specified"
+
+    @cached_property
+    def USE_METNO(self):
+        return self._WWO_KEY is None
+
+    @cached_property
+    def USER_AGENT(self):
+        return os.environ.get("WTTR_USER_AGENT", "")
+
+
+SETTINGS = Settings()
+
+
+def __getattr__(name):
+    # Backward compatibility: module-level access (e.g. globals.WWO_KEY) is resolved through SETTINGS
+    if not name.startswith("__") and hasattr(Settings, name):
+        return getattr(SETTINGS, name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
-TEMPLATES = os.path.join(MYDIR, 'share/templates')
-STATIC = os.path.join(MYDIR, 'share/static')
 
 NOT_FOUND_LOCATION = "not found"
 DEFAULT_LOCATION = "oymyakon"
@@ -65,15 +196,8 @@ GEOLOCATOR_SERVICE = 'http://localhost:8004'
 # (minute, hour, day) limitations:
 QUERY_LIMITS = (300, 3600, 24*3600)
 
-LISTEN_HOST = os.environ.get("WTTR_LISTEN_HOST", "")
-try:
-    LISTEN_PORT = int(os.environ.get("WTTR_LISTEN_PORT"))
-except (TypeError, ValueError):
-    LISTEN_PORT = 8002
-
 PROXY_HOST = "127.0.0.1"
 PROXY_PORT = 5001
-PROXY_CACHEDIR = os.path.join(_DATADIR, "cache/proxy-wwo/")
 
 MY_EXTERNAL_IP = '5.9.243.187'
 
@@ -94,35 +218,6 @@ PLAIN_TEXT_AGENTS = [
 
 PLAIN_TEXT_PAGES = [':help', ':bash.function', ':translation', ':iterm2']
 
-_IPLOCATION_ORDER = os.environ.get(
-    "WTTR_IPLOCATION_ORDER",
-    'geoip,ip2location,ipinfo')
-IPLOCATION_ORDER = _IPLOCATION_ORDER.split(',')
-
-_IP2LOCATION_KEY_FILE = os.environ.get(
-    "WTTR_IP2LOCATION_KEY_FILE",
-    os.environ['HOME'] + '/.ip2location.key')
-IP2LOCATION_KEY = None
-if os.path.exists(_IP2LOCATION_KEY_FILE):
-    IP2LOCATION_KEY = open(_IP2LOCATION_KEY_FILE, 'r').read().strip()
-
-_IPINFO_KEY_FILE = os.environ.get(
-    "WTTR_IPINFO_KEY_FILE",
-    os.environ['HOME'] + '/.ipinfo.key')
-IPINFO_TOKEN = None
-if os.path.exists(_IPINFO_KEY_FILE):
-    IPINFO_TOKEN = open(_IPINFO_KEY_FILE, 'r').read().strip()
-
-_WWO_KEY_FILE = os.environ.get(
-    "WTTR_WWO_KEY_FILE",
-    os.environ['HOME'] + '/.wwo.key')
-WWO_KEY = "key-is-not-specified"
-USE_METNO = True
-USER_AGENT = os.environ.get("WTTR_USER_AGENT", "")
-if os.path.exists(_WWO_KEY_FILE):
-    WWO_KEY = open(_WWO_KEY_FILE, 'r').read().strip()
-    USE_METNO = False
-
 def error(text):
     "log error `text` and raise a RuntimeError exception"
 
@@ -149,10 +244,10 @@ def debug_log(text):
 def get_help_file(lang):
     "Return help file for `lang`"
 
-    help_file = os.path.join(MYDIR, 'share/translations/%s-help.txt' % lang)
+    help_file = os.path.join(SETTINGS.MYDIR, 'share/translations/%s-help.txt' % lang)
     if os.path.exists(help_file):
         return help_file
-    return HELP_FILE
+    return SETTINGS.HELP_FILE
 
 def remove_ansi(sometext):
     ansi_escape = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -\/]*[@-~]')